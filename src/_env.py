@@ -0,0 +1,12 @@
+from dotenv import load_dotenv
+
+_LOADED = False
+
+def load_once():
+    """
+    Load the .env file into the process environment, at most once per process.
+    """
+    global _LOADED
+    if not _LOADED:
+        load_dotenv()
+        _LOADED = True
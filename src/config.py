@@ -1,20 +1,66 @@
 import os
-from dotenv import load_dotenv
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import socket
 import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Optional
 import logging
-from src.utils import get_openai_like_models, get_response_field_from_data
+from src._env import load_once
+from src.utils import _IDENTITY_ENCODING, get_openai_like_models, get_response_field_from_data, json_loads
 
 # Load environment variables
-load_dotenv()
+load_once()
+
+# Shared HTTP session so repeated model listings reuse keep-alive connections
+_SESSION = requests.Session()
+_RETRY = Retry(total=2, connect=1, read=1, backoff_factor=0.2, status_forcelist=[502, 503, 504])
+_ADAPTER = HTTPAdapter(pool_connections=10, pool_maxsize=50, max_retries=_RETRY)
+_SESSION.mount("http://", _ADAPTER)
+_SESSION.mount("https://", _ADAPTER)
+
+_DEFAULT_OLLAMA_TAGS_URL = "http://localhost:11434/api/tags"
+
+def _split_env_list(name: str) -> tuple[str, ...]:
+    """Parse a comma-separated environment variable into a tuple of names"""
+    return tuple(item.strip() for item in os.getenv(name, "").split(",") if item.strip())
 
 class ModelConfig:
+    __slots__ = (
+        "parallel_attempts",
+        "ollama_api_url",
+        "ollama_tags_url",
+        "openai_like_base_url",
+        "openai_like_api_key",
+        "_openai_models",
+        "_hf_models",
+        "_ggml_models",
+        "model_types",
+        "_models_cache",
+        "_resp_field_cache",
+        "_endpoints_cache",
+    )
+
+    # Substrings of a base URL that identify a LiteLLM or Ollama backend
+    _LITELLM_HINTS = ("4000", "litellm")
+    _OLLAMA_HINTS = ("11434", "ollama")
+
+    # Seconds a model listing is reused before the provider is queried again
+    MODELS_CACHE_TTL = 30
+    # Empty listings usually mean the provider is not set up, so they are kept longer
+    EMPTY_MODELS_CACHE_TTL = 60
+
     def __init__(self):
         self.parallel_attempts = int(os.getenv("PARALLEL_ATTEMPTS", "1"))
         self.ollama_api_url = os.getenv("OLLAMA_API_URL", "http://localhost:11434/api/generate")
+        self.ollama_tags_url = os.getenv("OLLAMA_TAGS_URL", _DEFAULT_OLLAMA_TAGS_URL)
         self.openai_like_base_url = os.getenv("OPENAI_LIKE_API_URL")
         self.openai_like_api_key = os.getenv("OPENAI_LIKE_API_KEY")
+        self._openai_models = _split_env_list("OPENAI_MODELS")
+        self._hf_models = _split_env_list("HUGGINGFACE_MODELS")
+        self._ggml_models = _split_env_list("GGML_MODELS")
         self.model_types = {
             "ollama": {
                 "type": "rest",
@@ -42,32 +88,43 @@ class ModelConfig:
                 "models": self._get_openai_like_models
             }
         }
+        self._models_cache: Dict[tuple, tuple[float, List[str]]] = {}
+        self._resp_field_cache: Dict[str, str] = {}
+        self._endpoints_cache: Dict[str, Dict[str, str]] = {}
 
     def _get_ollama_models(self) -> List[str]:
         """Get list of installed Ollama models"""
+        if self.ollama_tags_url == _DEFAULT_OLLAMA_TAGS_URL and not self._local_ollama_listening():
+            return []
         try:
-            response = requests.get(os.getenv("OLLAMA_TAGS_URL", "http://localhost:11434/api/tags"))
+            response = _SESSION.get(self.ollama_tags_url, headers=_IDENTITY_ENCODING, timeout=(2, 5))
             response.raise_for_status()
-            data = response.json()
-            return [model['name'] for model in data.get('models', [])]
-        except requests.exceptions.RequestException as e:
+            # Parse the raw bytes directly and keep only the names, not the full tag objects
+            return [model['name'] for model in json_loads(response.content).get('models', ())]
+        except (requests.exceptions.RequestException, ValueError) as e:
             logging.error(f"Error fetching Ollama models: {e}")
             return []
 
+    @staticmethod
+    def _local_ollama_listening() -> bool:
+        """Check whether anything accepts connections on the default local Ollama port"""
+        try:
+            with socket.create_connection(("localhost", 11434), timeout=0.1):
+                return True
+        except OSError:
+            return False
+
     def _get_openai_models(self) -> List[str]:
         """Get list of configured OpenAI models"""
-        models = os.getenv("OPENAI_MODELS", "").split(",")
-        return [model.strip() for model in models if model.strip()]
+        return list(self._openai_models)
 
     def _get_huggingface_models(self) -> List[str]:
         """Get list of configured HuggingFace models"""
-        models = os.getenv("HUGGINGFACE_MODELS", "").split(",")
-        return [model.strip() for model in models if model.strip()]
+        return list(self._hf_models)
 
     def _get_ggml_models(self) -> List[str]:
         """Get list of configured GGML models"""
-        models = os.getenv("GGML_MODELS", "").split(",")
-        return [model.strip() for model in models if model.strip()]
+        return list(self._ggml_models)
 
     def _get_openai_like_models(self) -> List[str]:
         """
@@ -79,7 +136,7 @@ class ModelConfig:
         if not base_url:
             return []
             
-        return get_openai_like_models(base_url, api_key)
+        return get_openai_like_models(base_url, api_key, session=_SESSION)
 
     def get_openai_like_endpoints(self, base_url: str) -> Dict[str, str]:
         """
@@ -91,25 +148,32 @@ class ModelConfig:
         Returns:
             Dict[str, str]: Dictionary with 'generate' and 'models' endpoints
         """
+        cached = self._endpoints_cache.get(base_url)
+        if cached is not None:
+            return cached
+
         # Try to detect the API type based on the base URL or port
-        if "4000" in base_url or "litellm" in base_url.lower():
+        lowered = base_url.lower()
+        if any(hint in lowered for hint in self._LITELLM_HINTS):
             # LiteLLM/OpenAI-compatible: response is in choices[0].message.content
-            return {
+            endpoints = {
                 "generate": "/v1/chat/completions",
                 "models": "/v1/models"
             }
-        elif "11434" in base_url or "ollama" in base_url.lower():
+        elif any(hint in lowered for hint in self._OLLAMA_HINTS):
             # Ollama endpoints
-            return {
+            endpoints = {
                 "generate": "/api/generate",
                 "models": "/api/tags"
             }
         else:
             # Default to OpenAI-compatible endpoints (most common)
-            return {
+            endpoints = {
                 "generate": "/v1/chat/completions",
                 "models": "/v1/models"
             }
+        self._endpoints_cache[base_url] = endpoints
+        return endpoints
 
     def get_response_json_field(self, base_url: str) -> str:
         """
@@ -121,52 +185,57 @@ class ModelConfig:
         Returns:
             str: The appropriate response_json_field value
         """
+        cached = self._resp_field_cache.get(base_url)
+        if cached is not None:
+            return cached
+
+        field = self._detect_response_json_field(base_url)
+        if field is None:
+            # The probe failed, so use the default without remembering it and retry next time
+            return "choices"
+        self._resp_field_cache[base_url] = field
+        return field
+
+    def _detect_response_json_field(self, base_url: str) -> str | None:
+        """
+        Resolve the response_json_field for a base URL, probing the API only when the URL is not recognised.
+
+        Returns None if the API could not be probed.
+        """
         # Try to detect the API type based on the base URL or port first
-        if "4000" in base_url or "litellm" in base_url.lower():
+        lowered = base_url.lower()
+        if any(hint in lowered for hint in self._LITELLM_HINTS):
             # LiteLLM/OpenAI-compatible: response is in choices[0].message.content
             return "choices"
-        elif "11434" in base_url or "ollama" in base_url.lower():
+        elif any(hint in lowered for hint in self._OLLAMA_HINTS):
             # Ollama-compatible: response is directly in response field
             return "response"
         
-        # For other URLs, try to test the actual API response
+        # For other URLs, test the single most likely generate endpoint once
+        headers = {"Content-Type": "application/json"}
+        api_key = self.openai_like_api_key
+        if api_key:
+            headers["Authorization"] = f"Bearer {api_key}"
+
         try:
-            # Try to make a test request to determine the response format
-            test_endpoints = [
-                "/v1/chat/completions",
-                "/api/generate",
-                "/api/chat"
-            ]
-            
-            headers = {"Content-Type": "application/json"}
-            api_key = self.openai_like_api_key
-            if api_key:
-                headers["Authorization"] = f"Bearer {api_key}"
+            url = base_url.rstrip("/") + self.get_openai_like_endpoints(base_url)["generate"]
+            # Make a minimal test request
+            test_request = {
+                "model": "test",
+                "messages": [{"role": "user", "content": "test"}],
+                "stream": False
+            }
             
-            for endpoint in test_endpoints:
-                try:
-                    url = base_url.rstrip("/") + endpoint
-                    # Make a minimal test request
-                    test_request = {
-                        "model": "test",
-                        "messages": [{"role": "user", "content": "test"}],
-                        "stream": False
-                    }
-                    
-                    response = requests.post(url, json=test_request, headers=headers, timeout=5)
-                    if response.status_code in [200, 400, 422]:  # Accept various error codes as valid responses
-                        data = response.json()
-                        # Use the utility function to determine the response field
-                        return get_response_field_from_data(data)
-                        
-                except requests.exceptions.RequestException:
-                    continue
-                    
-        except Exception as e:
+            response = _SESSION.post(url, json=test_request, headers=headers, timeout=(2, 3))
+            if response.status_code in [200, 400, 422]:  # Accept various error codes as valid responses
+                data = json_loads(response.content)
+                # Use the utility function to determine the response field
+                return get_response_field_from_data(data)
+        except (requests.exceptions.RequestException, ValueError) as e:
             logging.debug(f"Could not test API response format: {e}")
         
-        # Default to OpenAI-compatible if we can't determine
-        return "choices"
+        # Undetermined; the caller falls back to OpenAI-compatible
+        return None
 
     def set_parallel_attempts(self, attempts: int):
         """
@@ -192,7 +261,34 @@ class ModelConfig:
         if model_type not in self.model_types:
             raise ValueError(f"Invalid model type: {model_type}")
         
-        return self.model_types[model_type]["models"]()
+        info = self.model_types[model_type]
+        key = (model_type, info.get("api_url") or info.get("base_url"))
+        cached = self._models_cache.get(key)
+        if cached is not None:
+            ttl = self.MODELS_CACHE_TTL if cached[1] else self.EMPTY_MODELS_CACHE_TTL
+            if time.monotonic() - cached[0] < ttl:
+                return list(cached[1])
+
+        models = info["models"]()
+        self._models_cache[key] = (time.monotonic(), models)
+        return list(models)
+
+    def clear_models_cache(self):
+        """
+        Drop all cached model listings so the next call queries the providers again.
+        """
+        self._models_cache.clear()
+
+    def list_all_models(self) -> Dict[str, List[str]]:
+        """
+        List available models for every model type, querying the providers concurrently.
+        
+        Returns:
+            Dict[str, List[str]]: Mapping of model type to its available model names
+        """
+        with ThreadPoolExecutor(max_workers=len(self.model_types)) as executor:
+            futures = {model_type: executor.submit(self.list_models, model_type) for model_type in self.model_types}
+            return {model_type: future.result() for model_type, future in futures.items()}
 
     def get_model_type_info(self, model_type: str) -> Dict:
         """
@@ -213,8 +309,5 @@ if __name__ == "__main__":
     config = ModelConfig()
 
     logging.basicConfig(level=logging.INFO)
-    logging.info(config.list_models("ollama"))
-    logging.info(config.list_models("openai"))
-    logging.info(config.list_models("huggingface"))
-    logging.info(config.list_models("ggml"))
-    logging.info(config.list_models("openai_like"))
+    for model_type, models in config.list_all_models().items():
+        logging.info(f"{model_type}: {models}")
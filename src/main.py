@@ -6,7 +6,7 @@ import uvicorn
 # Add the parent directory to Python path to ensure src module can be found
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from src.server import mcp
+from src.server import mcp, STATELESS_HTTP
 
 app = mcp.streamable_http_app()
 
@@ -20,6 +20,15 @@ if __name__ == "__main__":
     import logging
     logging.info("Starting Garak MCP server...")
 
+    # Reload is for development only
+    reload = os.getenv("UVICORN_RELOAD", "0") == "1"
+    workers = int(os.getenv("UVICORN_WORKERS", "1")) or 1
+    # Stateful sessions live in one worker's memory, so follow-up requests routed
+    # to another worker would fail; only stateless HTTP can be spread across workers
+    if workers > 1 and not STATELESS_HTTP:
+        logging.warning("UVICORN_WORKERS > 1 requires MCP_STATELESS_HTTP=1; running a single worker")
+        workers = 1
+
     # Run the server
-    uvicorn.run("src.main:app", host="0.0.0.0", port=5000, reload=True)
+    uvicorn.run("src.main:app", host="0.0.0.0", port=5000, reload=reload, workers=1 if reload else workers)
     # asyncio.run(main())
\ No newline at end of file
@@ -1,18 +1,43 @@
 from mcp.server.fastmcp import FastMCP
+import asyncio
 from pathlib import Path
-import requests
-from src.utils import get_terminal_commands_output
+from src.utils import aget_terminal_commands_output, json_dumps, json_loads
 from src.config import ModelConfig
-import json
+import atexit
+import copy
+import logging
+import shutil
 import tempfile
+import threading
+import time
 import os
 
 REPORT_DIR = "./outputs"
 REPORT_PREFIX = f"{REPORT_DIR}"
+PROBE_PREFIX = "probes: "
+PROBE_CACHE_PATH = os.path.join(REPORT_DIR, ".probe_cache.json")
+# Largest report get_report_content returns inline
+MAX_REPORT_BYTES = 10 * 1024 * 1024
+# Keep generated generator configs in tmpfs when the host provides it
+_GENERATOR_OPTIONS_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+_CONFIG_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config')
 
 os.makedirs(REPORT_DIR, exist_ok=True)
 
 class GarakServer:
+    __slots__ = (
+        "model_types",
+        "config",
+        "_cached_probes",
+        "_cached_parsed_probes",
+        "_base_configs",
+        "_cfg_file_cache",
+        "_attack_sem",
+        "_base_args",
+        "_probe_lock",
+        "_cfg_lock",
+    )
+
     def __init__(self):
         self.model_types = {
             "ollama": "rest",
@@ -22,14 +47,43 @@ class GarakServer:
             "openai_like": "rest"
         }
         self.config = ModelConfig()
-        self._cached_probes = None
+        # The probe listing runs on the event loop, config files are written from worker threads
+        self._probe_lock = asyncio.Lock()
+        self._cfg_lock = threading.Lock()
+        cached = self._load_probe_cache()
+        self._cached_probes = (cached["lines"], None) if cached else None
+        self._cached_parsed_probes: list[dict] | None = cached["probes"] if cached else None
+        self._base_configs = {}
+        for base_config in ("ollama.json", "litellm.json"):
+            config_path = os.path.join(_CONFIG_DIR, base_config)
+            with open(config_path, 'rb') as f:
+                self._base_configs[base_config] = json_loads(f.read())
+        self._cfg_file_cache: dict[tuple, str] = {}
+        self._attack_sem = asyncio.Semaphore(self.config.parallel_attempts)
+        self._base_args = self._build_base_args()
+        atexit.register(self._cleanup_generator_options_files)
 
     def _get_generator_options_file(self, model_name: str, api_url: str | None = None, api_key: str | None = None, model_type: str = "ollama") -> str:
+        """
+        Get a config file for the given model, reusing the one written by a previous attack when possible.
+        """
+        # Resolve the response field once and outside the lock, since detection may hit the network.
+        # It is only remembered once known, so a config written with the fallback field is
+        # replaced as soon as detection succeeds
+        response_field = self.config.get_response_json_field(api_url) if model_type == "openai_like" else None
+        key = (model_name, api_url, api_key, model_type, response_field)
+        with self._cfg_lock:
+            cached_path = self._cfg_file_cache.get(key)
+            if cached_path is not None and os.path.exists(cached_path):
+                return cached_path
+            path = self._write_generator_options_file(model_name, api_url, api_key, model_type, response_field)
+            self._cfg_file_cache[key] = path
+            return path
+
+    def _write_generator_options_file(self, model_name: str, api_url: str | None, api_key: str | None, model_type: str, response_field: str | None) -> str:
         """
         Create a temporary config file with the model name and optionally a custom API URL and key set.
         """
-        import json, tempfile, os
-        
         # Choose the appropriate base config file and endpoints
         if model_type == "openai_like":
             # For OpenAI-like REST, determine endpoints based on the base URL
@@ -37,10 +91,7 @@ class GarakServer:
             endpoints = self.config.get_openai_like_endpoints(base_url)
             
             # Use OpenAI-compatible config as base for OpenAI-like REST
-            base_config = "litellm.json"
-            config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config', base_config)
-            with open(config_path, 'r') as f:
-                config = json.load(f)
+            config = copy.deepcopy(self._base_configs["litellm.json"])
             
             # Update the URI with the full endpoint
             full_url = base_url.rstrip("/") + endpoints["generate"]
@@ -49,8 +100,7 @@ class GarakServer:
             # Update the model name
             config['rest']['RestGenerator']['req_template_json_object']['model'] = model_name
             
-            # Set the appropriate response_json_field based on API type
-            response_field = self.config.get_response_json_field(base_url)
+            # Set the response_json_field resolved by the caller for this API type
             config['rest']['RestGenerator']['response_json_field'] = response_field
             
             # Add API key if provided
@@ -58,10 +108,7 @@ class GarakServer:
                 config['rest']['RestGenerator']['headers']["Authorization"] = f"Bearer {api_key}"
         else:
             # For Ollama, use the existing logic
-            base_config = "ollama.json"
-            config_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'config', base_config)
-            with open(config_path, 'r') as f:
-                config = json.load(f)
+            config = copy.deepcopy(self._base_configs["ollama.json"])
             
             config['rest']['RestGenerator']['req_template_json_object']['model'] = model_name
             if api_url:
@@ -69,22 +116,125 @@ class GarakServer:
             if api_key:
                 config['rest']['RestGenerator']['headers']["Authorization"] = f"Bearer {api_key}"
         
-        temp_file = tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.json')
-        json.dump(config, temp_file)
+        temp_file = tempfile.NamedTemporaryFile(mode='wb', delete=False, suffix='.json', dir=_GENERATOR_OPTIONS_DIR)
+        temp_file.write(json_dumps(config))
         temp_file.close()
         return temp_file.name
 
-    def list_garak_probes(self):
+    def _cleanup_generator_options_files(self):
+        """
+        Remove every cached generator config file, called once at interpreter shutdown.
+        """
+        with self._cfg_lock:
+            for path in self._cfg_file_cache.values():
+                if os.path.exists(path):
+                    os.unlink(path)
+            self._cfg_file_cache.clear()
+
+    def set_parallel_attempts(self, attempts: int):
+        """
+        Set the number of parallel attempts and resize the concurrent attack limit to match.
+
+        Args:
+            attempts (int): The number of parallel attempts to run
+        """
+        self.config.set_parallel_attempts(attempts)
+        self._attack_sem = asyncio.Semaphore(attempts)
+        self._base_args = self._build_base_args()
+
+    async def list_garak_probes(self):
         """
         List all available Garak attacks.
         """
         if self._cached_probes is not None:
             return self._cached_probes
-        lines, _ = get_terminal_commands_output(['garak', '--list_probes'])
-        self._cached_probes = (lines, None)
-        return self._cached_probes
+        async with self._probe_lock:
+            if self._cached_probes is not None:
+                return self._cached_probes
+            lines, _ = await aget_terminal_commands_output(['garak', '--list_probes'], filter_prefix=PROBE_PREFIX)
+            # An empty listing means garak is missing or failed, so let the next call retry
+            if lines:
+                self._cached_probes = (lines, None)
+            return lines, None
+
+    async def list_parsed_probes(self) -> list[dict]:
+        """
+        List all available Garak attacks as MCP text content, parsing the garak output at most once.
+        """
+        if self._cached_parsed_probes is not None:
+            return self._cached_parsed_probes
+        lines, _ = await self.list_garak_probes()
+        # No await between the check and the assignment, so concurrent callers cannot interleave here
+        if self._cached_parsed_probes is None:
+            probes = [
+                {"type": "text", "text": probe}
+                for line in lines if line.startswith(PROBE_PREFIX)
+                for probe in (line.removeprefix(PROBE_PREFIX).strip(),) if probe
+            ]
+            if not probes:
+                # Don't remember a failed listing, the next call runs garak again
+                return probes
+            self._save_probe_cache(lines, probes)
+            self._cached_parsed_probes = probes
+        return self._cached_parsed_probes
+
+    @staticmethod
+    def _garak_mtime() -> float | None:
+        """
+        Get the modification time of the garak executable, used to invalidate the probe cache.
+        """
+        garak_path = shutil.which('garak')
+        if garak_path is None:
+            return None
+        return os.stat(garak_path).st_mtime
+
+    def _load_probe_cache(self) -> dict | None:
+        """
+        Load the probe listing persisted by a previous run, if garak has not changed since.
+        """
+        try:
+            mtime = self._garak_mtime()
+            if mtime is None:
+                return None
+            with open(PROBE_CACHE_PATH, 'rb') as f:
+                cached = json_loads(f.read())
+        except (OSError, ValueError):
+            return None
+        # A cache written by another version or edited by hand must not break startup
+        if (
+            not isinstance(cached, dict)
+            or cached.get("mtime") != mtime
+            or not isinstance(cached.get("lines"), list)
+            or not isinstance(cached.get("probes"), list)
+        ):
+            return None
+        return cached
+
+    def _save_probe_cache(self, lines: list[str], probes: list[dict]):
+        """
+        Persist the probe listing atomically so restarts and other workers can reuse it.
 
-    def run_attack(self, model_type: str, model_name: str, probe_name: str):
+        The cache is best effort: failures are logged and the listing is still returned.
+        """
+        tmp_path = None
+        try:
+            mtime = self._garak_mtime()
+            if mtime is None:
+                return
+            cache_dir = os.path.dirname(PROBE_CACHE_PATH)
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(json_dumps({"mtime": mtime, "lines": lines, "probes": probes}))
+            os.replace(tmp_path, PROBE_CACHE_PATH)
+        except OSError as e:
+            logging.warning(f"Could not save probe cache to {PROBE_CACHE_PATH}: {e}")
+            if tmp_path is not None:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+
+    async def run_attack(self, model_type: str, model_name: str, probe_name: str):
         """
         Run an attack with the given model and probe.
 
@@ -97,60 +247,51 @@ class GarakServer:
             list: A list of vulnerabilities.
         """
         if model_type == "ollama":
-            config_file = self._get_generator_options_file(model_name, api_url=self.config.ollama_api_url)
-            try:
-                return get_terminal_commands_output([
-                    'garak',
-                    '--model_type', 'rest',
-                    '--generator_option_file', config_file,
-                    '--probes', probe_name,
-                    '--report_prefix', REPORT_PREFIX,
-                    "--generations", "1",
-                    "--config", "fast",
-                    "--parallel_attempts", str(self.config.parallel_attempts),
-                    "-v"
-                ])
-            finally:
-                # Clean up the temporary file
-                if os.path.exists(config_file):
-                    os.unlink(config_file)
+            return await self._run_rest(model_name, self.config.ollama_api_url, None, probe_name)
         elif model_type == "openai_like":
-            base_url = self.config.openai_like_base_url
-            api_key = self.config.openai_like_api_key
-            config_file = self._get_generator_options_file(model_name, api_url=base_url, api_key=api_key, model_type="openai_like")
-            try:
-                garak_command = [
-                    'garak',
-                    '--model_type', 'rest',
-                    '--generator_option_file', config_file,
-                    '--probes', probe_name,
-                    '--report_prefix', REPORT_PREFIX,
-                    "--generations", "1",
-                    "--config", "fast",
-                    "--parallel_attempts", str(self.config.parallel_attempts),
-                    "-v"
-                ]
-                import logging
-                logging.info(f"Running Garak command: {' '.join(garak_command)}")
-                return get_terminal_commands_output(garak_command)
-            finally:
-                if os.path.exists(config_file):
-                    os.unlink(config_file)
+            return await self._run_rest(model_name, self.config.openai_like_base_url, self.config.openai_like_api_key, probe_name, model_type="openai_like")
         else:
-            return get_terminal_commands_output([
+            return await aget_terminal_commands_output([
                 'garak',
                 '--model_type', model_type,
                 '--model_name', model_name,
                 '--probes', probe_name,
-                '--report_prefix', REPORT_PREFIX,
-                "--generations", "1",
-                "--config", "fast",
-                "--parallel_attempts", str(self.config.parallel_attempts),
-                "-v"
+                *self._base_args
             ])
 
+    async def _run_rest(self, model_name: str, api_url: str | None, api_key: str | None, probe_name: str, model_type: str = "ollama"):
+        """
+        Run an attack through garak's REST generator using a generated options file.
+        """
+        # Writing the config may probe the API for its response format, so keep it off the event loop
+        config_file = await asyncio.to_thread(self._get_generator_options_file, model_name, api_url, api_key, model_type)
+        garak_command = [
+            'garak',
+            '--model_type', 'rest',
+            '--generator_option_file', config_file,
+            '--probes', probe_name,
+            *self._base_args
+        ]
+        logging.info(f"Running Garak command: {' '.join(garak_command)}")
+        return await aget_terminal_commands_output(garak_command)
+
+    def _build_base_args(self) -> tuple[str, ...]:
+        """
+        Build the garak flags shared by every attack run.
+        """
+        return (
+            '--report_prefix', REPORT_PREFIX,
+            "--generations", "1",
+            "--config", "fast",
+            "--parallel_attempts", str(self.config.parallel_attempts),
+            "-v"
+        )
+
 # MCP Server
-mcp = FastMCP("garakmcp")
+# Stateless HTTP keeps no per-session state in memory, which running several workers requires
+STATELESS_HTTP = os.getenv("MCP_STATELESS_HTTP", "0") == "1"
+mcp = FastMCP("garakmcp", stateless_http=STATELESS_HTTP)
+_SERVER = GarakServer()
 
 @mcp.tool()
 def list_model_types():
@@ -160,10 +301,10 @@ def list_model_types():
     Returns:
         list[str]: A list of available model types.
     """
-    return list(GarakServer().model_types.keys())
+    return list(_SERVER.model_types.keys())
 
 @mcp.tool()
-def list_models(model_type: str) -> list[str]:
+async def list_models(model_type: str) -> list[str]:
     """
     List all available models for a given model type.
     Those models can be used for the attack and target models.
@@ -174,25 +315,43 @@ def list_models(model_type: str) -> list[str]:
     Returns:
         list[str]: A list of available models.
     """
-    return GarakServer().config.list_models(model_type)
+    return await asyncio.to_thread(_SERVER.config.list_models, model_type)
 
 @mcp.tool()
-def list_garak_probes():
+async def list_garak_probes():
     """
     List all available Garak attacks.
 
     Returns:
         dict: A dictionary with a 'content' key containing a list of probe names as dicts.
     """
-    lines, _ = GarakServer().list_garak_probes()
-    probes = []
-    for line in lines:
-        if line.startswith("probes: "):
-            probe = line[len("probes: "):].strip()
-            if probe:
-                probes.append({"type": "text", "text": probe})
+    probes = await _SERVER.list_parsed_probes()
     return {"content": probes, "isError": False}
 
+def _find_latest_report() -> Path | None:
+    """
+    Find the most recent report file in the output directory.
+    """
+    # Find the most recent .jsonl file in the output directory in a single pass
+    # (this also covers the default output.report.jsonl name)
+    latest_file = None
+    latest_ctime = -1.0
+    try:
+        with os.scandir(REPORT_DIR) as entries:
+            for entry in entries:
+                if entry.name.endswith(".jsonl") and entry.is_file():
+                    ctime = entry.stat().st_ctime
+                    if ctime > latest_ctime:
+                        latest_ctime, latest_file = ctime, entry.path
+    except FileNotFoundError:
+        logging.info(f"Report directory {REPORT_DIR} does not exist")
+        return None
+    
+    if latest_file:
+        logging.info(f"Latest report file found: {latest_file}")
+        return Path(latest_file).absolute()
+    return None
+
 @mcp.tool()
 def get_report():
     """
@@ -201,27 +360,28 @@ def get_report():
     Returns:
         str: The path of the report file.
     """
-    import os
-    import glob
-    import logging
+    return _find_latest_report()
 
-    # Look for any .jsonl files in the output directory
-    jsonl_files = glob.glob(os.path.join(REPORT_DIR, "*.jsonl"))
-    
-    if jsonl_files:
-        # Get the most recent file
-        latest_file = max(jsonl_files, key=os.path.getctime)
-        logging.info(f"Latest report file found: {latest_file}")
-        return Path(latest_file).absolute()
-    else:
-        # Fallback to the expected name
-        expected_file = Path(REPORT_DIR, 'output.report.jsonl')
-        if expected_file.exists():
-            logging.info(f"Fallback report file found: {expected_file}")
-            return expected_file.absolute()
+@mcp.tool()
+def get_report_content():
+    """
+    Get the contents of the report of the last run.
+
+    Returns:
+        str: The JSONL report, one JSON record per line.
+    """
+    report = _find_latest_report()
+    if report is None:
+        raise FileNotFoundError(f"No report found in {REPORT_DIR}")
+    with open(report, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size > MAX_REPORT_BYTES:
+            raise ValueError(f"Report {report} is {size} bytes, larger than the {MAX_REPORT_BYTES} byte limit; use get_report for its path")
+        # Read the whole file in one call now that its size is known
+        return f.read(size).decode('utf-8', errors='replace')
 
 @mcp.tool()
-def run_attack(model_type: str, model_name: str, probe_name: str):
+async def run_attack(model_type: str, model_name: str, probe_name: str):
     """
     Run an attack with the given model and probe which is a Garak attack.
 
@@ -233,14 +393,12 @@ def run_attack(model_type: str, model_name: str, probe_name: str):
     Returns:
         list: A list of vulnerabilities.
     """
-    import time
-    import logging
-    
     start_time = time.time()
     logging.info(f"Starting attack: {model_type}/{model_name} with probe {probe_name}")
     
     try:
-        result = GarakServer().run_attack(model_type, model_name, probe_name)
+        async with _SERVER._attack_sem:
+            result = await _SERVER.run_attack(model_type, model_name, probe_name)
         end_time = time.time()
         logging.info(f"Attack completed in {end_time - start_time:.2f} seconds")
         logging.info(f"Result: {result}")
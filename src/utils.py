@@ -1,34 +1,169 @@
 import re
+import json
+import time
+import hashlib
+import asyncio
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import signal
+import sqlite3
 import subprocess
+import threading
 import os
 import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from src._env import load_once
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, fall back to the stdlib json module
+    orjson = None
+try:
+    import zstandard
+except ImportError:  # zstandard is optional, large cached responses are then stored uncompressed
+    zstandard = None
+
+# Load environment variables before the module-level settings below read them
+load_once()
+
+# Ollama endpoints, resolved once at import; call reload_config after changing the environment
+OLLAMA_API_URL = os.getenv("OLLAMA_API_URL", "http://localhost:11434/api/generate")
+OLLAMA_TAGS_URL = os.getenv("OLLAMA_TAGS_URL", OLLAMA_API_URL.replace("/api/generate", "/api/tags"))
+# Optional comma-separated Ollama base URLs whose models are listed together
+OLLAMA_HOSTS = tuple(host.strip().rstrip("/") for host in os.getenv("OLLAMA_HOSTS", "").split(",") if host.strip())
+
+def reload_config():
+    """
+    Re-read the Ollama endpoint settings from the environment.
+    """
+    global OLLAMA_API_URL, OLLAMA_TAGS_URL, OLLAMA_HOSTS, _installed_models_cache
+    OLLAMA_API_URL = os.getenv("OLLAMA_API_URL", "http://localhost:11434/api/generate")
+    OLLAMA_TAGS_URL = os.getenv("OLLAMA_TAGS_URL", OLLAMA_API_URL.replace("/api/generate", "/api/tags"))
+    OLLAMA_HOSTS = tuple(host.strip().rstrip("/") for host in os.getenv("OLLAMA_HOSTS", "").split(",") if host.strip())
+    # Listings fetched from the old endpoint no longer apply
+    _installed_models_cache = None
+
+# Shared HTTP session so every helper reuses pooled keep-alive connections
+SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=32,
+    max_retries=Retry(total=3, backoff_factor=0.2, status_forcelist=[502, 503, 504])
+)
+SESSION.mount("http://", _ADAPTER)
+SESSION.mount("https://", _ADAPTER)
+SESSION.headers.update({
+    "Content-Type": "application/json",
+    "Connection": "keep-alive",
+    "Accept-Encoding": "gzip"
+})
 
 ansi_escape = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
 
 def sanitize_output(text: str) -> str:
     """
-    Remove non-ASCII characters (including emojis) from a string.
+    Remove ANSI escape sequences from a string.
     """
-    # return ''.join(c for c in text if ord(c) < 128)
+    # Most lines carry no escape sequences, so skip the regex for them
+    if '\x1b' not in text:
+        return text
     return ansi_escape.sub('', text)
 
+def json_loads(data: str | bytes):
+    """
+    Parse a JSON document, using orjson when it is installed.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def json_dumps(obj) -> bytes:
+    """
+    Serialize an object to UTF-8 encoded JSON, using orjson when it is installed.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode()
+
+# Seconds the installed Ollama model list is reused before /api/tags is queried again
+_INSTALLED_MODELS_TTL = 30
+# The tag listing is small JSON, so skip the gzip round trip for it
+_IDENTITY_ENCODING = {"Accept-Encoding": "identity"}
+_installed_models_cache: tuple[float, list[str]] | None = None
+
+def _fetch_ollama_tags(tags_url: str) -> list[str]:
+    """Fetch the model names listed by one Ollama /api/tags endpoint"""
+    response = SESSION.get(tags_url, headers=_IDENTITY_ENCODING, timeout=(3, 10))
+    response.raise_for_status()  # Raise an exception for bad status codes
+    data = json_loads(response.content)
+    return [model['name'] for model in data.get('models', [])]
+
+def _fetch_ollama_tags_from_hosts(hosts: tuple[str, ...]) -> list[str] | None:
+    """
+    Fetch the model names from several Ollama hosts concurrently, merged and deduplicated.
+    
+    Returns None if no host could be reached.
+    """
+    models: dict[str, None] = {}
+    reached = False
+    with ThreadPoolExecutor(max_workers=len(hosts)) as executor:
+        futures = [executor.submit(_fetch_ollama_tags, f"{host}/api/tags") for host in hosts]
+        # Merge in host order so the listing is stable between calls
+        for host, future in zip(hosts, futures):
+            try:
+                models.update(dict.fromkeys(future.result()))
+                reached = True
+            except (requests.exceptions.RequestException, ValueError) as e:
+                logger.error(f"Error fetching Ollama models from {host}: {e}")
+    return list(models) if reached else None
+
 def get_installed_ollama_models():
     """
     Fetch a list of all installed Ollama models.
     
+    When OLLAMA_HOSTS is set, every listed host is queried concurrently and the
+    model names are merged. Successful listings are reused for a short time; call
+    refresh_installed_ollama_models after installing a new model to see it immediately.
+    
     Returns:
         list: A list of installed model names
     """
-    tags_url = os.getenv("OLLAMA_TAGS_URL", os.getenv("OLLAMA_API_URL", "http://localhost:11434/api/generate").replace("/api/generate", "/api/tags"))
-    try:
-        response = requests.get(tags_url)
-        response.raise_for_status()  # Raise an exception for bad status codes
-        data = response.json()
-        return [model['name'] for model in data.get('models', [])]
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Error fetching Ollama models: {e}")
-        return []
+    global _installed_models_cache
+    cached = _installed_models_cache
+    if cached is not None and time.monotonic() - cached[0] < _INSTALLED_MODELS_TTL:
+        return list(cached[1])
+
+    if OLLAMA_HOSTS:
+        models = _fetch_ollama_tags_from_hosts(OLLAMA_HOSTS)
+        if models is None:
+            return []
+    else:
+        try:
+            models = _fetch_ollama_tags(OLLAMA_TAGS_URL)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.error(f"Error fetching Ollama models: {e}")
+            return []
+    _installed_models_cache = (time.monotonic(), models)
+    return list(models)
+
+def refresh_installed_ollama_models():
+    """
+    Drop the cached Ollama model list and fetch it again.
+    
+    Returns:
+        list: A list of installed model names
+    """
+    global _installed_models_cache
+    _installed_models_cache = None
+    return get_installed_ollama_models()
+
+# Response field patterns in order of preference
+_RESPONSE_FIELDS = ("choices", "response", "output", "content", "text")
 
 def get_response_field_from_data(data: dict) -> str:
     """
@@ -40,28 +175,148 @@ def get_response_field_from_data(data: dict) -> str:
     Returns:
         str: The appropriate response field name
     """
-    # Try different response field patterns in order of preference
-    response_fields = ["choices", "response", "output", "content", "text"]
+    # Default to "choices" if no field is found
+    return next((field for field in _RESPONSE_FIELDS if field in data), "choices")
+
+def _extract_model_names(data) -> list:
+    """
+    Extract model names from the model listing formats used by the various providers.
     
-    for field in response_fields:
-        if field in data:
-            return field
+    Args:
+        data (dict | list): The parsed response of a models endpoint
+        
+    Returns:
+        list: The model names found, empty if the format is not recognised
+    """
+    if isinstance(data, dict):
+        if "data" in data:  # OpenAI format (most common)
+            return [model["id"] for model in data["data"]]
+        elif "models" in data:  # Ollama format
+            return [model["name"] for model in data["models"]]
+        elif "model_list" in data:  # Some providers use model_list
+            return [model["id"] for model in data["model_list"]]
+        elif "available_models" in data:  # Some providers use available_models
+            return [model["id"] for model in data["available_models"]]
+    elif isinstance(data, list):
+        # Try to extract model names from list
+        models = []
+        for item in data:
+            if isinstance(item, dict):
+                if "id" in item:
+                    models.append(item["id"])
+                elif "name" in item:
+                    models.append(item["name"])
+                elif "model" in item:
+                    models.append(item["model"])
+        return models
+    return []
+
+# Try different common endpoints for generation
+_GENERATE_ENDPOINTS = (
+    "/v1/chat/completions",  # OpenAI-compatible (most common)
+    "/api/generate",         # Ollama-compatible
+    "/api/chat",             # Common REST pattern
+    "/generate",             # Simple pattern
+    "/chat"                  # Simple pattern
+)
+
+def _generate_request_formats(model: str, prompt: str) -> list[dict]:
+    """
+    Build the request bodies to try against a generate endpoint, most common format first.
+    """
+    return [
+        # OpenAI-compatible format (most common)
+        {
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+            "stream": False
+        },
+        # Ollama-compatible format
+        {
+            "model": model,
+            "prompt": prompt,
+            "stream": False
+        },
+        # Simple format
+        {
+            "model": model,
+            "input": prompt
+        }
+    ]
+
+def _extract_response_text(data: dict) -> str | None:
+    """
+    Extract the generated text from a completion response, if it has a known shape.
     
-    # Default to "choices" if no field is found
-    return "choices"
+    Args:
+        data (dict): The parsed response of a generate endpoint
+        
+    Returns:
+        str | None: The generated text, or None if the format is not recognised
+    """
+    # Get the response field and extract the content
+    response_field = get_response_field_from_data(data)
+    if response_field in data:
+        if response_field == "choices" and isinstance(data[response_field], list) and len(data[response_field]) > 0:
+            choice = data[response_field][0]
+            if "message" in choice and "content" in choice["message"]:
+                return choice["message"]["content"]
+            elif "text" in choice:
+                return choice["text"]
+        elif isinstance(data[response_field], str):
+            return data[response_field]
+    return None
+
+# Endpoint (and request format index) that last worked for each base URL, tried first next time
+_OK_MODELS_ENDPOINT: dict[str, str] = {}
+_OK_GENERATE_ATTEMPT: dict[str, tuple[str, int]] = {}
+
+def _fetch_models(http, url: str, headers: dict) -> list:
+    """
+    Query one models endpoint, returning an empty list on any failure.
+    """
+    try:
+        response = http.get(url, headers=headers, timeout=(2, 5))
+        if response.status_code != 200:
+            return []
+        return _extract_model_names(response.json())
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logger.debug(f"Failed to fetch models from {url}: {e}")
+        return []
+
+def _post_generate(http, url: str, request_format: dict, headers: dict) -> str | None:
+    """
+    Send one generate request, returning None on any failure, unrecognised or empty response.
+    """
+    try:
+        response = http.post(url, json=request_format, headers=headers, timeout=90)
+        if response.status_code != 200:
+            return None
+        # An empty answer usually means the body did not match the endpoint (e.g. Ollama
+        # /api/generate given chat messages), so keep looking
+        return _extract_response_text(response.json()) or None
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logger.debug(f"Failed to generate response from {url}: {e}")
+        return None
 
-def get_openai_like_models(base_url: str, api_key: str = None):
+def get_openai_like_models(base_url: str, api_key: str = None, session: requests.Session = None):
     """
     Fetch a list of models from an OpenAI-like REST API supporting all LiteLLM providers.
     
+    The endpoint that worked last time is tried alone first; otherwise all candidate
+    endpoints are queried concurrently and the most preferred one with a usable answer wins.
+    
     Args:
         base_url (str): The base URL of the REST API (e.g., "http://localhost:4000")
         api_key (str, optional): API key for authentication
+        session (requests.Session, optional): Session to use instead of the shared SESSION
         
     Returns:
         list: A list of available model names
     """
 
+    http = session or SESSION
+    root = base_url.rstrip("/")
     endpoints_to_try = [
         # OpenAI-compatible endpoints (most common)
         "/v1/models",                    # OpenAI, Azure OpenAI, Vertex AI, Google AI Studio, etc.
@@ -69,183 +324,507 @@ def get_openai_like_models(base_url: str, api_key: str = None):
         "/models",                       # Simple pattern
     ]
     
-    # Use headers from the REST generator templates
-    headers = {"Content-Type": "application/json"}
-    if api_key:
-        headers["Authorization"] = f"Bearer {api_key}"
+    # Content-Type comes from the session (or requests for JSON bodies), only auth varies per call
+    headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
     
-    for endpoint in endpoints_to_try:
-        try:
-            url = base_url.rstrip("/") + endpoint
-            response = requests.get(url, headers=headers, timeout=10)
-            if response.status_code == 200:
-                data = response.json()
-                
-                # Handle different response formats from various providers
-                if isinstance(data, dict):
-                    if "data" in data:  # OpenAI format (most common)
-                        return [model["id"] for model in data["data"]]
-                    elif "models" in data:  # Ollama format
-                        return [model["name"] for model in data["models"]]
-                    elif "model_list" in data:  # Some providers use model_list
-                        return [model["id"] for model in data["model_list"]]
-                    elif "available_models" in data:  # Some providers use available_models
-                        return [model["id"] for model in data["available_models"]]
-                elif isinstance(data, list):
-                    # Try to extract model names from list
-                    models = []
-                    for item in data:
-                        if isinstance(item, dict):
-                            if "id" in item:
-                                models.append(item["id"])
-                            elif "name" in item:
-                                models.append(item["name"])
-                            elif "model" in item:
-                                models.append(item["model"])
-                    if models:
-                        return models
-                        
-        except requests.exceptions.RequestException as e:
-            logging.debug(f"Failed to fetch models from {endpoint}: {e}")
-            continue
+    known = _OK_MODELS_ENDPOINT.get(base_url)
+    if known is not None:
+        models = _fetch_models(http, root + known, headers)
+        if models:
+            return models
+    
+    executor = ThreadPoolExecutor(max_workers=len(endpoints_to_try))
+    futures = [
+        (endpoint, executor.submit(_fetch_models, http, root + endpoint, headers))
+        for endpoint in endpoints_to_try
+    ]
+    try:
+        # Accept an answer only once every more preferred endpoint has failed
+        for endpoint, future in futures:
+            models = future.result()
+            if models:
+                _OK_MODELS_ENDPOINT[base_url] = endpoint
+                return models
+    finally:
+        # Don't wait for the less preferred endpoints once an answer is found
+        executor.shutdown(wait=False, cancel_futures=True)
     
     # Fallback: return a single model if specified in env
     model = os.getenv("OPENAI_LIKE_MODEL")
     return [model] if model else []
 
-def generate_openai_like_response(base_url: str, model: str, prompt: str, api_key: str = None):
+def generate_openai_like_response(base_url: str, model: str, prompt: str, api_key: str = None, session: requests.Session = None):
     """
     Generate a response from an OpenAI-like REST API.
 
+    The endpoint and request format that worked last time are tried alone first; otherwise
+    the combinations are tried one at a time in order of preference. They are not raced,
+    because each attempt is a real (possibly billed) generation.
+
     Args:
         base_url (str): The base URL of the REST API (e.g., "http://localhost:4000")
         model (str): The name of the model to use
         prompt (str): The prompt to send to the model
         api_key (str, optional): API key for authentication
+        session (requests.Session, optional): Session to use instead of the shared SESSION
 
     Returns:
         str: The model's response
     """
-    # Try different common endpoints for generation
-    endpoints_to_try = [
-        "/v1/chat/completions",  # OpenAI-compatible (most common)
-        "/api/generate",         # Ollama-compatible
-        "/api/chat",             # Common REST pattern
-        "/generate",             # Simple pattern
-        "/chat"                  # Simple pattern
-    ]
+    http = session or SESSION
+    root = base_url.rstrip("/")
+    request_formats = _generate_request_formats(model, prompt)
     
-    # Use headers from the REST generator templates
-    headers = {"Content-Type": "application/json"}
-    if api_key:
-        headers["Authorization"] = f"Bearer {api_key}"
+    # Content-Type comes from the session (or requests for JSON bodies), only auth varies per call
+    headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
     
-    for endpoint in endpoints_to_try:
-        try:
-            url = base_url.rstrip("/") + endpoint
-            
-            # Try different request formats
-            request_formats = [
-                # OpenAI-compatible format (most common)
-                {
-                    "model": model,
-                    "messages": [{"role": "user", "content": prompt}],
-                    "stream": False
-                },
-                # Ollama-compatible format
-                {
-                    "model": model,
-                    "prompt": prompt,
-                    "stream": False
-                },
-                # Simple format
-                {
-                    "model": model,
-                    "input": prompt
-                }
-            ]
-            
-            for request_format in request_formats:
-                try:
-                    response = requests.post(url, json=request_format, headers=headers, timeout=90)
-                    if response.status_code == 200:
-                        data = response.json()
-                        
-                        # Get the response field and extract the content
-                        response_field = get_response_field_from_data(data)
-                        if response_field in data:
-                            if response_field == "choices" and isinstance(data[response_field], list) and len(data[response_field]) > 0:
-                                choice = data[response_field][0]
-                                if "message" in choice and "content" in choice["message"]:
-                                    return sanitize_output(choice["message"]["content"])
-                                elif "text" in choice:
-                                    return sanitize_output(choice["text"])
-                            elif isinstance(data[response_field], str):
-                                return sanitize_output(data[response_field])
-                                    
-                except requests.exceptions.RequestException:
-                    continue
-                    
-        except requests.exceptions.RequestException as e:
-            logging.debug(f"Failed to generate response from {endpoint}: {e}")
-            continue
+    known = _OK_GENERATE_ATTEMPT.get(base_url)
+    if known is not None:
+        endpoint, format_index = known
+        text = _post_generate(http, root + endpoint, request_formats[format_index], headers)
+        if text is not None:
+            return sanitize_output(text)
     
-    logging.error(f"Failed to generate response from OpenAI-like API at {base_url}")
+    for endpoint in _GENERATE_ENDPOINTS:
+        for format_index, request_format in enumerate(request_formats):
+            if (endpoint, format_index) == known:
+                continue
+            text = _post_generate(http, root + endpoint, request_format, headers)
+            if text is not None:
+                _OK_GENERATE_ATTEMPT[base_url] = (endpoint, format_index)
+                return sanitize_output(text)
+    
+    logger.error(f"Failed to generate response from OpenAI-like API at {base_url}")
+    return ""
+
+async def agenerate_openai_like_response(base_url: str, model: str, prompt: str, api_key: str = None, client: httpx.AsyncClient = None):
+    """
+    Generate a response from an OpenAI-like REST API without blocking the event loop.
+
+    Same endpoint and request format search as generate_openai_like_response, so callers can
+    asyncio.gather many generations over one client. Attempts for one prompt run one at a
+    time in order of preference, since each is a real (possibly billed) generation.
+
+    Args:
+        base_url (str): The base URL of the REST API (e.g., "http://localhost:4000")
+        model (str): The name of the model to use
+        prompt (str): The prompt to send to the model
+        api_key (str, optional): API key for authentication
+        client (httpx.AsyncClient, optional): Client to reuse pooled connections from
+
+    Returns:
+        str: The model's response
+    """
+    if client is None:
+        async with httpx.AsyncClient(timeout=90) as own_client:
+            return await agenerate_openai_like_response(base_url, model, prompt, api_key, own_client)
+
+    root = base_url.rstrip("/")
+    request_formats = _generate_request_formats(model, prompt)
+    headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+
+    async def attempt(endpoint: str, format_index: int) -> str | None:
+        url = root + endpoint
+        try:
+            response = await client.post(url, json=request_formats[format_index], headers=headers)
+            if response.status_code != 200:
+                return None
+            # Empty answers mean the body did not match the endpoint, as in _post_generate
+            return _extract_response_text(response.json()) or None
+        except (httpx.HTTPError, ValueError) as e:
+            logger.debug(f"Failed to generate response from {url}: {e}")
+            return None
+
+    known = _OK_GENERATE_ATTEMPT.get(base_url)
+    if known is not None:
+        text = await attempt(*known)
+        if text is not None:
+            return sanitize_output(text)
+
+    for endpoint in _GENERATE_ENDPOINTS:
+        for format_index in range(len(request_formats)):
+            if (endpoint, format_index) == known:
+                continue
+            text = await attempt(endpoint, format_index)
+            if text is not None:
+                _OK_GENERATE_ATTEMPT[base_url] = (endpoint, format_index)
+                return sanitize_output(text)
+
+    logger.error(f"Failed to generate response from OpenAI-like API at {base_url}")
     return ""
 
-def get_terminal_commands_output(command: list[str]):
+def _log_output_lines(lines: list[str]):
+    """
+    Log captured command output as a single debug record instead of one record per line.
+    """
+    if lines and logger.isEnabledFor(logging.DEBUG):
+        logger.debug("\n".join(lines))
+
+def _clean_output_line(raw: str, filter_prefix: str | None = None) -> str | None:
+    """
+    Sanitize one line of command output, returning None if it is empty or filtered out.
+    """
+    # ANSI codes never split the prefix, so this skips lines that cannot match cheaply
+    if filter_prefix is not None and filter_prefix not in raw:
+        return None
+    line = sanitize_output(raw).strip()
+    if not line or (filter_prefix is not None and not line.startswith(filter_prefix)):
+        return None
+    return line
+
+def _kill_process_tree(process: subprocess.Popen | asyncio.subprocess.Process):
+    """
+    Kill a command started by one of the command runners together with its process group.
+    """
+    try:
+        if os.name == "nt":
+            process.kill()
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        # The command already exited
+        pass
+
+def get_terminal_commands_output(command: list[str], filter_prefix: str | None = None, timeout: float | None = None):
     """
     Run a command in the terminal and return the output and process ID.
     
+    Args:
+        command (list[str]): The command and its arguments
+        filter_prefix (str, optional): Only keep output lines starting with this prefix
+        timeout (float, optional): Kill the command if it is still running after this many seconds
+
     Returns:
         tuple: A tuple containing (output_lines, process_id)
     """
     output_lines: list[str] = []
+    if not command:
+        logger.error("Refusing to run an empty command")
+        return output_lines, None
 
+    # Exec the argv directly; only Windows needs the shell to resolve the garak script,
+    # and there the argv is quoted into one command line explicitly
+    use_shell = os.name == "nt"
     try:
-        # Use shell=True for Windows compatibility
         process = subprocess.Popen(
-            " ".join(command),
+            subprocess.list2cmdline(command) if use_shell else command,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             text=True,
-            shell=True,
-            universal_newlines=True
+            bufsize=1,
+            shell=use_shell,
+            # With a deadline, give the child its own process group so its helpers die with it
+            start_new_session=(timeout is not None and os.name != "nt")
         )
         
-        logging.info(f"Process ID: {process.pid}")
+        logger.info(f"Process ID: {process.pid}")
         
-        # Read all output at once to avoid deadlocks
-        stdout, stderr = process.communicate()
-        if stdout:
-            lines = [sanitize_output(line.strip()) for line in stdout.split('\n') if line.strip()]
-            output_lines.extend(lines)
-            for line in lines:
-                logging.info(line)
+        # Drain stderr on a separate thread so a full pipe cannot deadlock the child
+        stderr_chunks: list[str] = []
+        stderr_reader = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+        stderr_reader.start()
+
+        # Killing the child closes its pipes, which ends the read loop below at the deadline
+        killer = None
+        if timeout is not None:
+            killer = threading.Timer(timeout, _kill_process_tree, args=(process,))
+            killer.daemon = True
+            killer.start()
+
+        # Process stdout line by line as it arrives
+        try:
+            with process.stdout:
+                for raw in process.stdout:
+                    line = _clean_output_line(raw, filter_prefix)
+                    if line:
+                        output_lines.append(line)
+        finally:
+            if killer is not None:
+                killer.cancel()
+
+        _log_output_lines(output_lines)
+
+        process.wait()
+        if killer is not None and process.returncode is not None and process.returncode < 0:
+            logger.error(f"Command {command} was killed after {timeout} seconds")
+        stderr_reader.join()
+        process.stderr.close()
+        stderr = "".join(stderr_chunks)
         if stderr:
-            logging.error(f"Error output: {sanitize_output(stderr)}")
+            logger.error(f"Error output: {sanitize_output(stderr)}")
         
         return output_lines, process.pid
-    except subprocess.SubprocessError as e:
-        logging.error(f"Error running command {command}: {e}")
+    except (subprocess.SubprocessError, OSError) as e:
+        logger.error(f"Error running command {command}: {e}")
+        return output_lines, None
+
+
+async def _drain_lines(stream: asyncio.StreamReader, lines: list[str], filter_prefix: str | None = None):
+    """
+    Read a subprocess stream to EOF, appending the sanitized non-empty lines as they arrive.
+    """
+    async for raw in stream:
+        line = _clean_output_line(raw.decode(errors="replace"), filter_prefix)
+        if line:
+            lines.append(line)
+
+async def aget_terminal_commands_output(command: list[str], filter_prefix: str | None = None, timeout: float | None = None):
+    """
+    Run a command without blocking the event loop and return the output and process ID.
+    
+    Args:
+        command (list[str]): The command and its arguments
+        filter_prefix (str, optional): Only keep output lines starting with this prefix
+        timeout (float, optional): Kill the command if it is still running after this many seconds
+
+    Returns:
+        tuple: A tuple containing (output_lines, process_id)
+    """
+    output_lines: list[str] = []
+    if not command:
+        logger.error("Refusing to run an empty command")
+        return output_lines, None
+
+    try:
+        # Allow long verbose lines from garak instead of the default 64KiB line limit, and give
+        # the child its own process group so a deadline or cancellation also stops its workers
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            limit=2 ** 20,
+            start_new_session=(os.name != "nt")
+        )
+    except OSError as e:
+        logger.error(f"Error running command {command}: {e}")
         return output_lines, None
 
+    logger.info(f"Process ID: {process.pid}")
+
+    # Drain stderr concurrently so a full pipe cannot deadlock the child
+    stderr_task = asyncio.create_task(process.stderr.read())
+    try:
+        await asyncio.wait_for(_drain_lines(process.stdout, output_lines, filter_prefix), timeout)
+    except asyncio.TimeoutError:
+        # Killing the whole group closes the pipes, so the waits below return promptly
+        logger.error(f"Command {command} was killed after {timeout} seconds")
+        _kill_process_tree(process)
+    except (ValueError, asyncio.LimitOverrunError) as e:
+        # A line longer than the stream limit cannot be read; stop the command and keep what we have
+        logger.error(f"Command {command} was killed after an unreadable output line: {e}")
+        _kill_process_tree(process)
+    except asyncio.CancelledError:
+        # The caller went away (e.g. the client disconnected); don't leave the command orphaned
+        _kill_process_tree(process)
+        stderr_task.cancel()
+        await process.wait()
+        raise
+    _log_output_lines(output_lines)
+
+    await process.wait()
+    stderr = (await stderr_task).decode(errors="replace")
+    if stderr:
+        logger.error(f"Error output: {sanitize_output(stderr)}")
+
+    return output_lines, process.pid
+
+
+# Maximum Ollama generate requests in flight for batched prompts
+BATCH_CONCURRENCY = 8
+
+# Exact-match cache of Ollama responses keyed by a hash of (model, prompt), oldest evicted first
+_RESPONSE_CACHE: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+_RESPONSE_CACHE_MAX = 1024
+_RESPONSE_CACHE_TTL = float(os.getenv("OLLAMA_CACHE_TTL", "1800"))
+_RESPONSE_CACHE_LOCK = threading.Lock()
+
+def _response_cache_key(model: str, prompt: str) -> str:
+    """Hash a model and prompt pair into a response cache key"""
+    return hashlib.sha256(f"{model}\0{prompt}".encode()).hexdigest()
+
+# Optional on-disk copy of the response cache so responses survive restarts
+_RESPONSE_DB_PATH = os.getenv("OLLAMA_CACHE_DB", "")
+_RESPONSE_DB: sqlite3.Connection | None = None
+_RESPONSE_DB_LOCK = threading.Lock()
+# Responses above this size are compressed on disk when zstandard is installed
+_RESPONSE_DB_COMPRESS_MIN = 4096
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+def _response_db() -> sqlite3.Connection | None:
+    """Open the on-disk response cache on first use, or return None if it is disabled"""
+    global _RESPONSE_DB, _RESPONSE_DB_PATH
+    if _RESPONSE_DB is None and _RESPONSE_DB_PATH:
+        try:
+            db = sqlite3.connect(_RESPONSE_DB_PATH, isolation_level=None, check_same_thread=False)
+            # WAL lets other processes read the cache while this one writes
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache "
+                "(key TEXT PRIMARY KEY, model TEXT, prompt TEXT, response BLOB, ts REAL)"
+            )
+            _RESPONSE_DB = db
+        except sqlite3.Error as e:
+            logger.error(f"Disabling on-disk response cache {_RESPONSE_DB_PATH}: {e}")
+            _RESPONSE_DB_PATH = ""
+    return _RESPONSE_DB
+
+def _encode_cached_response(text: str) -> bytes:
+    """Encode a response for the on-disk cache, compressing large ones"""
+    data = text.encode()
+    if zstandard is not None and len(data) > _RESPONSE_DB_COMPRESS_MIN:
+        return zstandard.ZstdCompressor().compress(data)
+    return data
+
+def _decode_cached_response(data: bytes) -> str:
+    """Decode a response read from the on-disk cache"""
+    # UTF-8 text never starts with the zstd frame magic, so the prefix marks compressed rows
+    if data.startswith(_ZSTD_MAGIC):
+        if zstandard is None:
+            raise ValueError("cached response is zstd-compressed but zstandard is not installed")
+        data = zstandard.ZstdDecompressor().decompress(data)
+    return data.decode()
+
+def _load_db_response(key: str) -> tuple[float, str] | None:
+    """Read a fresh response from the on-disk cache"""
+    db = _response_db()
+    if db is None:
+        return None
+    try:
+        with _RESPONSE_DB_LOCK:
+            row = db.execute("SELECT response, ts FROM llm_cache WHERE key=?", (key,)).fetchone()
+        if row is None or time.time() - row[1] >= _RESPONSE_CACHE_TTL:
+            return None
+        return row[1], _decode_cached_response(row[0])
+    except (sqlite3.Error, ValueError) as e:
+        logger.error(f"Error reading on-disk response cache: {e}")
+        return None
+
+def _save_db_response(key: str, model: str, prompt: str, ts: float, text: str):
+    """Write a response to the on-disk cache"""
+    db = _response_db()
+    if db is None:
+        return
+    try:
+        with _RESPONSE_DB_LOCK:
+            db.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, model, prompt, response, ts) VALUES (?, ?, ?, ?, ?)",
+                (key, model, prompt, _encode_cached_response(text), ts)
+            )
+    except sqlite3.Error as e:
+        logger.error(f"Error writing on-disk response cache: {e}")
+
+def _get_cached_response(key: str) -> str | None:
+    """Return a cached response if it exists and has not expired"""
+    with _RESPONSE_CACHE_LOCK:
+        cached = _RESPONSE_CACHE.get(key)
+        if cached is not None:
+            if time.time() - cached[0] < _RESPONSE_CACHE_TTL:
+                _RESPONSE_CACHE.move_to_end(key)
+                return cached[1]
+            del _RESPONSE_CACHE[key]
+
+    # Fall back to the on-disk copy and promote hits into memory
+    cached = _load_db_response(key)
+    if cached is None:
+        return None
+    _remember_response(key, *cached)
+    return cached[1]
 
-def generate_ollama_response(model: str, prompt: str) -> str:
+def _remember_response(key: str, ts: float, text: str):
+    """Put a response in the in-memory cache, evicting the least recently used entry when full"""
+    with _RESPONSE_CACHE_LOCK:
+        _RESPONSE_CACHE[key] = (ts, text)
+        _RESPONSE_CACHE.move_to_end(key)
+        if len(_RESPONSE_CACHE) > _RESPONSE_CACHE_MAX:
+            _RESPONSE_CACHE.popitem(last=False)
+
+def _store_cached_response(key: str, text: str, model: str, prompt: str):
+    """Cache a response in memory and, when enabled, on disk"""
+    ts = time.time()
+    _remember_response(key, ts, text)
+    _save_db_response(key, model, prompt, ts, text)
+
+def generate_ollama_response(model: str, prompt: str, sanitize: bool = True) -> str:
     """
     Generate a response from an Ollama model.
 
     Args:
         model (str): The name of the Ollama model to use (e.g., "llama3.2:3b")
         prompt (str): The prompt to send to the model
+        sanitize (bool): Strip ANSI escape sequences from the response; pass False when the caller validates it
+
+    Returns:
+        str: The model's response
+    """
+    # The cache holds raw responses so sanitized and unsanitized callers share entries
+    key = _response_cache_key(model, prompt)
+    text = _get_cached_response(key)
+    if text is None:
+        try:
+            # Assemble the streamed chunks as they arrive rather than waiting for one buffered body
+            text = "".join(stream_ollama_response(model, prompt))
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.error(f"Error generating response from Ollama: {e}")
+            return ""
+        _store_cached_response(key, text, model, prompt)
+    return sanitize_output(text) if sanitize else text
+
+def stream_ollama_response(model: str, prompt: str):
+    """
+    Stream a response from an Ollama model, yielding text chunks as the model produces them.
+
+    Args:
+        model (str): The name of the Ollama model to use (e.g., "llama3.2:3b")
+        prompt (str): The prompt to send to the model
+
+    Yields:
+        str: The next chunk of the model's response (not sanitized)
+
+    Raises:
+        ValueError: If Ollama reports an error mid-stream or the stream ends before it is done
+    """
+    payload = {
+        "model": model,
+        "prompt": prompt,
+        "stream": True
+    }
+    with SESSION.post(OLLAMA_API_URL, json=payload, stream=True, timeout=(3, 600)) as response:
+        response.raise_for_status()
+        # Ollama streams newline-delimited JSON objects
+        for line in response.iter_lines():
+            if not line:
+                continue
+            chunk = json_loads(line)
+            if "error" in chunk:
+                raise ValueError(f"Ollama stream failed: {chunk['error']}")
+            yield chunk.get("response", "")
+            if chunk.get("done"):
+                return
+    # A stream cut short is a partial answer and must not be cached as a complete one
+    raise ValueError("Ollama stream ended before the response was done")
+
+
+async def agenerate_ollama_response(client: httpx.AsyncClient, model: str, prompt: str, sanitize: bool = True) -> str:
+    """
+    Generate a response from an Ollama model without blocking the event loop.
+
+    Args:
+        client (httpx.AsyncClient): Client to send the request with
+        model (str): The name of the Ollama model to use (e.g., "llama3.2:3b")
+        prompt (str): The prompt to send to the model
+        sanitize (bool): Strip ANSI escape sequences from the response; pass False when the caller validates it
 
     Returns:
         str: The model's response
     """
-    api_url = os.getenv("OLLAMA_API_URL", "http://localhost:11434/api/generate")
+    key = _response_cache_key(model, prompt)
+    cached = _get_cached_response(key)
+    if cached is not None:
+        return sanitize_output(cached) if sanitize else cached
+
     try:
-        response = requests.post(
-            api_url,
+        response = await client.post(
+            OLLAMA_API_URL,
             json={
                 "model": model,
                 "prompt": prompt,
@@ -253,16 +832,58 @@ def generate_ollama_response(model: str, prompt: str) -> str:
             }
         )
         response.raise_for_status()
-        return sanitize_output(response.json()["response"])
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Error generating response from Ollama: {e}")
+        text = json_loads(response.content)["response"]
+        _store_cached_response(key, text, model, prompt)
+        return sanitize_output(text) if sanitize else text
+    except (httpx.HTTPError, ValueError, KeyError) as e:
+        logger.error(f"Error generating response from Ollama: {e}")
         return ""
 
+async def generate_many(model: str, prompts: list[str]) -> list[str]:
+    """
+    Generate responses for many prompts from an Ollama model concurrently.
+
+    Args:
+        model (str): The name of the Ollama model to use (e.g., "llama3.2:3b")
+        prompts (list[str]): The prompts to send to the model
+
+    Returns:
+        list[str]: The model's responses, in the same order as the prompts
+    """
+    limits = httpx.Limits(max_connections=16, keepalive_expiry=60)
+    in_flight = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def bounded(client: httpx.AsyncClient, prompt: str) -> str:
+        async with in_flight:
+            return await agenerate_ollama_response(client, model, prompt)
+
+    async with httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(300, connect=3)) as client:
+        return await asyncio.gather(*(bounded(client, prompt) for prompt in prompts))
+
+def generate_ollama_responses(model: str, prompts: list[str]) -> list[str]:
+    """
+    Generate responses for many prompts from an Ollama model over the shared session.
+
+    Up to BATCH_CONCURRENCY requests are in flight at once, and this is safe to call from
+    synchronous code whether or not an event loop is running.
+
+    Args:
+        model (str): The name of the Ollama model to use (e.g., "llama3.2:3b")
+        prompts (list[str]): The prompts to send to the model
+
+    Returns:
+        list[str]: The model's responses, in the same order as the prompts
+    """
+    if not prompts:
+        return []
+    with ThreadPoolExecutor(max_workers=min(BATCH_CONCURRENCY, len(prompts))) as executor:
+        return list(executor.map(lambda prompt: generate_ollama_response(model, prompt), prompts))
+
 
 if __name__ == "__main__":
     
-    logging.info("\nAvailable Garak probes:")
+    logger.info("\nAvailable Garak probes:")
     probes, pid = get_terminal_commands_output(['garak', '--list_probes'])
-    logging.info(f"Process ID: {pid}")
+    logger.info(f"Process ID: {pid}")
     for probe in probes:
-        logging.info(f"- {probe}")
\ No newline at end of file
+        logger.info(f"- {probe}")
\ No newline at end of file